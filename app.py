@@ -1,13 +1,85 @@
-from flask import Flask, render_template, request
-from utils.youtube_api import search_youtube_covers
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import TTLCache
+from flask import Flask, jsonify, render_template, request, url_for
+from utils.youtube_api import get_cached_search, search_youtube_covers
 from utils.analytics import (
     get_top_covers, calculate_trend_score, generate_trend_summary, 
-    get_monthly_upload_data, classify_video_title, classify_cover_type
+    get_monthly_upload_data, classify_video_title, classify_cover_type,
+    VideoColumns
 )
-from utils.ml_classifier import cluster_cover_videos
+from utils.ml_classifier import cluster_cover_videos, find_keywords, count_bucket_hits, warm_up
 
 app = Flask(__name__)
 
+# ML clustering normally runs off the request thread: /results renders
+# straight away and the page polls /results/ml?song=... until the clusters
+# are ready. Jobs are keyed by the normalized song query and kept for 10
+# minutes. A poll that finds no job (another worker/instance served the
+# search, or the job was evicted) recomputes from the cached search instead.
+_ML_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+_ML_JOBS = TTLCache(maxsize=256, ttl=10 * 60)
+_ML_JOBS_LOCK = threading.Lock()
+
+# Serverless platforms like Vercel freeze background threads once the
+# response is sent, so there ML runs inline and is rendered with the page
+RUN_ML_INLINE = bool(os.getenv("VERCEL"))
+
+if not RUN_ML_INLINE:
+    # Load scikit-learn in the background at startup so the first search
+    # doesn't wait on the import
+    _ML_EXECUTOR.submit(warm_up)
+
+def _ml_job_key(song_query):
+    return song_query.strip().lower()
+
+def split_and_classify(videos):
+    """
+    Split search results into (cover_videos, noise_videos) and annotate
+    each cover with its rule-based type and per-bucket keyword counts.
+    """
+    cover_videos = []
+    noise_videos = []
+    for video in videos:
+        classification, title_lower = classify_video_title(video['title'])
+        if classification != 'cover':
+            noise_videos.append(video)
+            continue
+        cover_videos.append(video)
+
+        # One keyword scan per cover feeds both the rule-based type and the
+        # per-bucket counts used to name the ML clusters
+        text_lower = title_lower + " " + (video.get('description') or "").lower()
+        keywords = find_keywords(text_lower)
+        video['_bucket_counts'] = count_bucket_hits(keywords)
+
+        # Add Stable, Rule-Based data
+        rule_classification = classify_cover_type(video, keywords=keywords)
+        video["rule_name"] = rule_classification["name"]
+        video["rule_icon"] = rule_classification["icon"]
+
+    return cover_videos, noise_videos
+
+def run_ml_pipeline(cover_videos, song_query):
+    """
+    Cluster the cover videos and return the JSON-ready ML results:
+    cluster name per cover (keyed by video URL), plot data and top keywords.
+    """
+    cluster_results = cluster_cover_videos(cover_videos, song_query=song_query)
+    labels = cluster_results["labels"]
+    cluster_name_map = cluster_results["cluster_name_map"]
+
+    return {
+        "ml_names": {
+            video["url"]: cluster_name_map.get(label, "Other")
+            for video, label in zip(cover_videos, labels)
+        },
+        "plot_data": cluster_results["plot_data"],
+        "top_keywords": cluster_results["top_keywords"]
+    }
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -26,43 +98,29 @@ def results():
     total_results = len(videos)
 
     # 1. Classify videos first
-    cover_videos = []
-    noise_videos = []
-    for video in videos:
-        classification = classify_video_title(video['title'])
-        if classification == 'cover':
-            cover_videos.append(video)
-        else:
-            noise_videos.append(video)
-    
+    cover_videos, noise_videos = split_and_classify(videos)
+
     cover_count = len(cover_videos)
 
     # 2. Run analytics ONLY on the clean cover_videos list
+    cover_columns = VideoColumns.from_videos(cover_videos)
     top_covers = get_top_covers(cover_videos)
-    trend_score = calculate_trend_score(cover_videos)
+    trend_score = calculate_trend_score(cover_columns)
     trend_summary = generate_trend_summary(trend_score)
-    months, upload_counts = get_monthly_upload_data(cover_videos)
+    months, upload_counts = get_monthly_upload_data(cover_columns)
 
 
-    # 3. Run ML on cover videos
-    cluster_results = cluster_cover_videos(cover_videos, song_query=song_query)
-    labels = cluster_results["labels"]
-    cluster_name_map = cluster_results["cluster_name_map"]
-    plot_data = cluster_results["plot_data"]
-    top_keywords = cluster_results["top_keywords"]
+    # 3. Run ML on cover videos, inline or in the background
+    ml_payload = None
+    ml_job_url = None
+    if cover_videos and RUN_ML_INLINE:
+        ml_payload = run_ml_pipeline(cover_videos, song_query)
+    elif cover_videos:
+        future = _ML_EXECUTOR.submit(run_ml_pipeline, cover_videos, song_query)
+        with _ML_JOBS_LOCK:
+            _ML_JOBS[_ml_job_key(song_query)] = future
+        ml_job_url = url_for("ml_results", song=song_query)
 
-    # Assign cluster labels and names back into each video
-    for i, video in enumerate(cover_videos):
-        # Add Stable, Rule-Based data
-        rule_classification = classify_cover_type(video)
-        video["rule_name"] = rule_classification["name"]
-        video["rule_icon"] = rule_classification["icon"]
-        
-        # Add Volatile, ML-Based data
-        ml_label = labels[i]
-        video["ml_name"] = cluster_name_map.get(ml_label, "Other")
-    
-    
     return render_template(
         "results.html",
         videos=videos, 
@@ -76,10 +134,39 @@ def results():
         noise_videos=noise_videos,
         cover_count=cover_count,
         total_results=total_results,
-        plot_data=plot_data,
-        top_keywords=top_keywords
+        ml_results=ml_payload,
+        ml_job_url=ml_job_url
     )
 
+@app.route("/results/ml")
+def ml_results():
+    song_query = request.args.get("song")
+    if not song_query:
+        return jsonify({"status": "missing"}), 404
+
+    with _ML_JOBS_LOCK:
+        future = _ML_JOBS.get(_ml_job_key(song_query))
+
+    if future is None:
+        # No job here (another worker ran the search, or the job expired).
+        # Recompute only from a search this process already has cached; a
+        # poll must never spend API quota on a fresh search.
+        videos = get_cached_search(song_query)
+        if videos is None:
+            return jsonify({"status": "expired"}), 404
+        cover_videos, _ = split_and_classify(videos)
+        return jsonify({"status": "done", **run_ml_pipeline(cover_videos, song_query)})
+    if not future.done():
+        return jsonify({"status": "pending"}), 202
+
+    try:
+        payload = future.result()
+    except Exception as e:
+        print(f"Error during ML pipeline: {e}")
+        return jsonify({"status": "error"}), 500
+
+    return jsonify({"status": "done", **payload})
+
 
 if __name__ == '__main__':
     app.run(debug=True)
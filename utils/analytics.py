@@ -1,6 +1,6 @@
 # utils/analytics.py
-from datetime import datetime
-from collections import Counter
+from dataclasses import dataclass
+from datetime import date
 import numpy as np
 import re
 
@@ -19,71 +19,103 @@ COVER_TYPE_MAP = {
     "other": {"name": "Other / Remix", "icon": "bi bi-question-circle-fill"}
 }
 
+def _keyword_pattern(keywords):
+    # One alternation over the keywords: a single regex scan instead of a
+    # Python loop doing one substring search per keyword
+    return re.compile("|".join(re.escape(kw) for kw in dict.fromkeys(keywords)))
+
+# Buckets in priority order. All keywords are lowercase (or Japanese, which
+# .lower() leaves untouched), so matching the lowered text is enough.
+COVER_TYPE_KEYWORDS = [
+    ("acoustic", ACOUSTIC_KEYWORDS),
+    ("band", BAND_KEYWORDS),
+    ("vocal", VOCAL_KEYWORDS),
+    ("instrumental", INSTRUMENTAL_KEYWORDS),
+]
+
+COVER_TYPE_PATTERNS = [(bucket, _keyword_pattern(kws)) for bucket, kws in COVER_TYPE_KEYWORDS]
+
 # Rule-based NLP classification
-def classify_cover_type(video):
+def classify_cover_type(video, keywords=None):
     """
     Classifies a single video into a cover category using stable rules.
+    keywords is the set of keywords already found in the video's lowered
+    title + description; when omitted the text is scanned here.
     Returns a dict with 'name' and 'icon'.
     """
-    # Combine title and description for a full text search
-    # Give title more weight by adding it twice
-    title = video.get("title", "")
-    description = video.get("description", "")
-    # Use the full, non-lowercased text for Japanese matching
-    text_to_check_raw = (title + " " + title + " " + description)
-    text_to_check_lower = text_to_check_raw.lower()
-
-    # Check in order of priority
-    for kw in ACOUSTIC_KEYWORDS:
-        if kw in text_to_check_lower:
-            return COVER_TYPE_MAP["acoustic"]
-    
-    for kw in BAND_KEYWORDS:
-        if kw in text_to_check_lower:
-            return COVER_TYPE_MAP["band"]
-            
-    for kw in VOCAL_KEYWORDS:
-        if kw in text_to_check_lower or kw in text_to_check_raw:
-            return COVER_TYPE_MAP["vocal"]
-            
-    for kw in INSTRUMENTAL_KEYWORDS:
-        if kw in text_to_check_lower or kw in text_to_check_raw:
-            return COVER_TYPE_MAP["instrumental"]
+    if keywords is None:
+        # Combine title and description for a full text search, one regex
+        # scan per bucket in order of priority
+        text_to_check_lower = (video.get("title", "") + " " + video.get("description", "")).lower()
+        for bucket, pattern in COVER_TYPE_PATTERNS:
+            if pattern.search(text_to_check_lower):
+                return COVER_TYPE_MAP[bucket]
+    else:
+        # Check in order of priority
+        for bucket, kws in COVER_TYPE_KEYWORDS:
+            if not keywords.isdisjoint(kws):
+                return COVER_TYPE_MAP[bucket]
 
     # Fallback if no keywords are found
     return COVER_TYPE_MAP["other"]
 
+@dataclass
+class VideoColumns:
+    """
+    Columnar view of the fields the trend analytics read, built once per
+    result list so each analytic works on NumPy arrays instead of
+    pulling values out of every video dict.
+    """
+    views: np.ndarray         # int64
+    upload_dates: np.ndarray  # datetime64[D], NaT where the date is missing
+
+    @classmethod
+    def from_videos(cls, videos):
+        return cls(
+            views=np.fromiter((v["views"] for v in videos), dtype=np.int64, count=len(videos)),
+            upload_dates=np.array([v.get("upload_date") for v in videos], dtype="datetime64[D]")
+        )
+
+    def __len__(self):
+        return len(self.views)
+
+def _as_columns(videos):
+    # Accept either a prebuilt VideoColumns or a list of video dicts
+    if isinstance(videos, VideoColumns):
+        return videos
+    return VideoColumns.from_videos(videos)
+
 def get_top_covers(videos, top_n=3):
     """Return the top N most viewed covers."""
     return sorted(videos, key=lambda v: v["views"], reverse=True)[:top_n]
 
+def _recency_from_days(days_ago):
+    # Linear decay from 1 (uploaded today) to 0 (a year or more ago); one
+    # vectorized expression, so there is no per-video loop left to compile
+    return np.clip(1 - np.minimum(days_ago / 365, 1), 0, None)
+
 def calculate_trend_score(videos):
     """
     Calculate a basic trend score based on:
     - How many covers exist
     - How recent they are
     - Total engagement (views)
+    videos: list of video dicts or a VideoColumns
     """
     if not videos:
         return 0
-
-    now = datetime.now()
-    # Convert upload dates to recency weights
-    recency_scores = []
-    total_views = 0
-
-    for v in videos:
-        try:
-            upload_date = datetime.fromisoformat(v["upload_date"])
-        except:
-            upload_date = datetime.strptime(v["upload_date"], "%Y-%m-%d")
-
-        days_ago = (now - upload_date).days
-        recency = max(0, 1 - min(days_ago / 365, 1))  # 1 if recent, 0 if >1 year
-        recency_scores.append(recency)
-        total_views += v["views"]
-
-    avg_recency = np.mean(recency_scores)
+    columns = _as_columns(videos)
+
+    # Score recency for every upload date as one array:
+    # 1 if recent, 0 if >1 year (or unknown)
+    today = np.datetime64(date.today(), "D")
+    known = ~np.isnat(columns.upload_dates)
+    days_ago = (today - columns.upload_dates[known]).astype(np.int64)
+    recency = np.zeros(len(columns))
+    recency[known] = _recency_from_days(days_ago)
+
+    avg_recency = recency.mean()
+    total_views = int(columns.views.sum())
     num_covers = len(videos)
 
     # Normalize trend score (heuristic formula)
@@ -113,77 +145,54 @@ def generate_trend_summary(score):
 def get_monthly_upload_data(videos):
     """
     Return labels (months) and counts for Chart.js visualization.
+    videos: list of video dicts or a VideoColumns
+    """
+    # Bucket upload dates by month; np.unique returns the months already
+    # in chronological order along with how many uploads fall in each
+    upload_dates = _as_columns(videos).upload_dates
+    upload_months = upload_dates[~np.isnat(upload_dates)].astype("datetime64[M]")
+    months, counts = np.unique(upload_months, return_counts=True)
+
+    # Month-year strings like "2025-11"
+    return months.astype(str).tolist(), counts.tolist()
+
+# Title filter keywords
+COVER_KEYWORDS = [
+    # English
+    "cover", "acoustic", "band cover", "piano cover",
+    "guitar cover", "drum cover", "instrumental cover",
+    "vocals cover", "acoustic version", "arrangement",
+    "cover version", "cover by",
+
+    # Japanese
+    "歌ってみた",        # tried singing (most common)
+    "弾いてみた",        # tried playing (guitar/piano)
+    "叩いてみた",        # tried drumming
+    "弾き語り",          # acoustic self-play-and-sing
+    "弾き語ってみた",    # “tried performing acoustic”
+    "カバー",           # cover (JP)
+    "アレンジ",         # arrangement
+    "ピアノ",           # piano
+    "ギター",           # guitar
+    "バンドカバー",      # band cover
+    "インスト",          # instrumental
+    "アコースティック",   # acoustic
+    "歌わせていただきました", "歌ってみた"
+]
+
+_COVER_RE = _keyword_pattern(COVER_KEYWORDS)
+
+def classify_video_title(title: str) -> tuple[str, str]:
+    """
+    Returns (classification, lowercased title) so callers can reuse the
+    lowered title instead of lowercasing it again.
     """
-    # Extract upload dates in YYYY-MM-DD format
-    upload_dates = [v['upload_date'] for v in videos if 'upload_date' in v]
-    
-    # Convert to month-year strings like "2025-11"
-    months = [datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m") for date in upload_dates]
-    
-    # Count how many uploads per month
-    month_counts = Counter(months)
-    
-    # Sort by chronological order
-    sorted_months = sorted(month_counts.keys())
-    upload_counts = [month_counts[m] for m in sorted_months]
-    
-    return sorted_months, upload_counts
-
-def classify_video_title(title: str) -> str:
     t = title.lower()
-    
-    # Japanese lowercase equivalents
-    tj = title  # keep raw for multi-byte Japanese
-    
-    cover_keywords = [
-        # English
-        "cover", "acoustic", "band cover", "piano cover",
-        "guitar cover", "drum cover", "instrumental cover",
-        "vocals cover", "acoustic version", "arrangement",
-        "cover version", "cover by",
-        
-        # Japanese
-        "歌ってみた",        # tried singing (most common)
-        "弾いてみた",        # tried playing (guitar/piano)
-        "叩いてみた",        # tried drumming
-        "弾き語り",          # acoustic self-play-and-sing
-        "弾き語ってみた",    # “tried performing acoustic”
-        "カバー",           # cover (JP)
-        "アレンジ",         # arrangement
-        "ピアノ",           # piano
-        "ギター",           # guitar
-        "バンドカバー",      # band cover
-        "インスト",          # instrumental
-        "アコースティック",   # acoustic
-        "歌わせていただきました", "歌ってみた"
-    ]
-    
-    noise_keywords = [
-        # English
-        "official music video", "official video", "mv", "m/v",
-        "official audio", "lyric", "lyrics", "karaoke",
-        "remix", "slowed", "reverb", "reaction",
-        "live", "performance", "short", "shorts",
-        "teaser", "trailer", "full album", "concert",
-        
-        # Japanese
-        "公式",          # official
-        "ミュージックビデオ", # music video
-        "歌詞",          # lyrics
-        "カラオケ",      # karaoke
-        "ライブ",        # live
-        "生放送",        # live stream
-        "ショート",      # shorts
-    ]
-    
+
     # Covers
-    for word in cover_keywords:
-        if word in t or word in tj:
-            return "cover"
-    
-    # Noise first
-    for word in noise_keywords:
-        if word in t or word in tj:
-            return "noise"
-    
-    return "noise"  # ambiguous = noise
+    if _COVER_RE.search(t):
+        return "cover", t
+
+    # Anything that doesn't match a cover keyword (official MVs, lyric
+    # videos, karaoke, live performances, ...) is noise
+    return "noise", t  # ambiguous = noise
@@ -1,12 +1,15 @@
 # utils/ml_classifier.py
-from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
-from sklearn.cluster import KMeans
-from sklearn.manifold import TSNE  
-import numpy as np
+# scikit-learn (and scipy beneath it) takes a second or more to import, so
+# it is imported inside cluster_cover_videos instead of here: pages that
+# never cluster don't pay for it. See warm_up() for preloading it.
+from collections import Counter
+import math
 import re
 
-# Custom stop words list
-JUNK_STOP_WORDS = list(ENGLISH_STOP_WORDS) + [
+from utils.analytics import COVER_TYPE_KEYWORDS
+
+# Custom stop words list (used on top of scikit-learn's English stop words)
+JUNK_STOP_WORDS = [
     # Web/URL junk
     'https', 'http', 'com', 'www', 'net', 'org', 'jp', 'info',
     'twitter', 'x', 'facebook', 'instagram', 'youtu', 'youtube', 'watch',
@@ -48,47 +51,71 @@ def _text_for_video(v):
     desc = v.get("description", "") or ""
     return (title + " " + desc).strip()
 
-def _count_matches(text_lower, keywords):
-    # simple substring match (case-insensitive)
-    count = 0
-    for kw in keywords:
-        if kw in text_lower:
-            count += 1
-    return count
+# Cluster names and their keyword buckets. The order fixes each cluster's
+# label index and the column order of count_bucket_hits; it does not break
+# ties, since tied or keyword-less videos get -1 (FALLBACK_NAME).
+CLUSTER_BUCKETS = [
+    ("Vocal cover", VOCAL_KEYWORDS),
+    ("Instrumental", INSTRUMENTAL_KEYWORDS),
+    ("Acoustic / Soft", ACOUSTIC_KEYWORDS),
+    ("Band / Full Arrangement", BAND_KEYWORDS),
+]
+
+def _build_keyword_scan():
+    # Every keyword used for cluster naming or rule-based cover typing,
+    # longest first so that at each position the lookahead reports the
+    # longest keyword starting there. Any shorter keyword matching at the
+    # same spot is a substring of it, so each hit is expanded to all the
+    # keywords it contains; that recovers exactly the set of keywords that
+    # occur in the text from a single pass.
+    keywords = set()
+    for _, kws in CLUSTER_BUCKETS + COVER_TYPE_KEYWORDS:
+        keywords.update(kws)
+    ordered = sorted(keywords, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in ordered) + "))")
+    contained = {kw: frozenset(k for k in keywords if k in kw) for kw in keywords}
+    return pattern, contained
 
-def map_clusters_to_names(videos, labels):
+_KEYWORD_SCAN_RE, _CONTAINED_KEYWORDS = _build_keyword_scan()
+
+def find_keywords(text_lower):
     """
-    Given videos (list of dicts) and labels (list/array),
-    return a dict: cluster_index -> human-readable name
+    Return the set of bucket keywords (cluster and cover-type buckets)
+    that appear in the lowercased text, using one regex pass.
     """
-    cluster_texts = {}
-    for v, lab in zip(videos, labels):
-        cluster_texts.setdefault(lab, []).append(_text_for_video(v).lower())
-
-    mapping = {}
-    for lab, texts in cluster_texts.items():
-        # aggregate counts per keyword group
-        vocal_count = sum(_count_matches(t, VOCAL_KEYWORDS) for t in texts)
-        inst_count  = sum(_count_matches(t, INSTRUMENTAL_KEYWORDS) for t in texts)
-        acou_count  = sum(_count_matches(t, ACOUSTIC_KEYWORDS) for t in texts)
-        band_count  = sum(_count_matches(t, BAND_KEYWORDS) for t in texts)
-
-        # choose the highest hit group
-        counts = {
-            "Vocal cover": vocal_count,
-            "Instrumental": inst_count,
-            "Acoustic / Soft": acou_count,
-            "Band / Full Arrangement": band_count
-        }
+    found = set()
+    for match in _KEYWORD_SCAN_RE.finditer(text_lower):
+        found |= _CONTAINED_KEYWORDS[match.group(1)]
+    return found
 
-        # pick max; if all zero, fallback
-        best_name, best_val = max(counts.items(), key=lambda kv: kv[1])
-        if best_val == 0:
-            mapping[lab] = FALLBACK_NAME
-        else:
-            mapping[lab] = best_name
+def count_bucket_hits(keywords):
+    """
+    Given the keywords found in a video, return how many keywords of each
+    cluster bucket matched, in CLUSTER_BUCKETS order.
+    """
+    return [sum(1 for kw in kws if kw in keywords) for _, kws in CLUSTER_BUCKETS]
 
-    return mapping
+def _bucket_counts_for(v):
+    # Use the counts precomputed by the caller, scanning only if missing
+    counts = v.get("_bucket_counts")
+    if counts is None:
+        counts = count_bucket_hits(find_keywords(_text_for_video(v).lower()))
+    return counts
+
+def assign_bucket_labels(videos):
+    """
+    Label each video with the index of the CLUSTER_BUCKETS entry its
+    keywords hit most, or -1 when nothing matches or the top buckets tie.
+    """
+    labels = []
+    for v in videos:
+        counts = _bucket_counts_for(v)
+        best = max(counts)
+        if best > 0 and counts.count(best) == 1:
+            labels.append(counts.index(best))
+        else:
+            labels.append(-1)
+    return labels
 
 def preprocess_text_for_tfidf(text):
     if not text:
@@ -109,55 +136,77 @@ def preprocess_text_for_tfidf(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def get_top_keywords_per_cluster(kmeans, vectorizer, cluster_name_map, n_keywords=5):
+def _pretokenized(tokens):
+    # Analyzer for documents that were already tokenized
+    return tokens
+
+def get_top_keywords_per_cluster(labels, doc_tokens, cluster_name_map, n_keywords=5):
     """
-    Finds the top N keywords (TF-IDF features) for each named cluster.
+    Finds the top N keywords for each named cluster: terms scored by how
+    many of the cluster's documents contain them, weighted by IDF
+    (log(N / df)) over all documents so terms shared by every cluster
+    don't crowd out the distinctive ones. Hashed features have no
+    vocabulary to map back from, so this works on the tokens directly.
     """
     try:
+        # Count each term once per document so a single long
+        # description can't dominate its cluster
+        doc_terms = [set(tokens) for tokens in doc_tokens]
+
+        doc_freq = Counter()
+        for terms in doc_terms:
+            doc_freq.update(terms)
+        num_docs = len(doc_terms)
+
+        term_counts = {}
+        for lab, terms in zip(labels, doc_terms):
+            name = cluster_name_map.get(int(lab), FALLBACK_NAME)
+            term_counts.setdefault(name, Counter()).update(terms)
+
         keywords = {}
-        # Get the words for each feature index
-        terms = vectorizer.get_feature_names_out()
-        # Get the "center" of each cluster
-        cluster_centers = kmeans.cluster_centers_
-        
-        # Get the original cluster index (0, 1, 2, 3) for each cluster name
-        name_to_index = {}
-        for idx, name in cluster_name_map.items():
-            # Handle potential duplicate names (e.g., two clusters map to "Other")
-            if name not in name_to_index:
-                name_to_index[name] = idx
-            
-        for name, idx in name_to_index.items():
-            # Get the scores for this cluster's center
-            center = cluster_centers[idx]
-            # Find the indices of the top N keywords
-            top_indices = np.argsort(center)[::-1][:n_keywords]
-            # Map indices to words
-            top_terms = [terms[i] for i in top_indices]
-            keywords[name] = top_terms
-            
+        for name, counts in term_counts.items():
+            scores = {
+                term: count * math.log(num_docs / doc_freq[term])
+                for term, count in counts.items()
+            }
+            # Terms found in every document score 0 and say nothing
+            ranked = sorted(
+                (term for term, score in scores.items() if score > 0),
+                key=lambda term: (-scores[term], term)
+            )
+            if ranked:
+                keywords[name] = ranked[:n_keywords]
+
         return keywords
 
     except Exception as e:
         print(f"Error getting top keywords: {e}")
         return {} # Return empty on error
 
-def cluster_cover_videos(videos, song_query="", max_features=800):
+def warm_up():
+    """Import scikit-learn ahead of the first clustering request."""
+    import sklearn.decomposition
+    import sklearn.feature_extraction.text
+
+def cluster_cover_videos(videos, song_query="", n_features=2**12):
     """
+    Groups cover videos by their dominant keyword bucket (see
+    assign_bucket_labels) and builds the 2D plot and per-cluster top
+    keywords from the hashed TF-IDF vectors of their text.
     videos: list of dicts (each must have title and description)
-    returns: (labels_list, cluster_index_to_name_dict)
+    returns: dict with labels, cluster_name_map, plot_data, top_keywords
     """
-    num_clusters = 4
-    
-    # Safety check for when n_samples < n_clusters
-    # If we have fewer videos than clusters (e.g., 2 videos, 4 clusters),
-    # or no videos at all, clustering is impossible.
-    # So, we'll just assign them all to the fallback group (cluster 0).
-    if len(videos) < num_clusters:
-        labels_list = [0] * len(videos) # e.g., [0, 0] if len(videos) == 2
-        cluster_name_map = { 0: FALLBACK_NAME }
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, ENGLISH_STOP_WORDS
+    from sklearn.decomposition import TruncatedSVD
+
+    # The keyword buckets are the clusters; labels don't depend on TF-IDF
+    labels = assign_bucket_labels(videos)
+    cluster_name_map = {i: name for i, (name, _) in enumerate(CLUSTER_BUCKETS)}
+    cluster_name_map[-1] = FALLBACK_NAME
+
+    if not videos:
         return {
-            "labels": labels_list,
+            "labels": [],
             "cluster_name_map": cluster_name_map,
             "plot_data": [],
             "top_keywords": {}
@@ -169,72 +218,54 @@ def cluster_cover_videos(videos, song_query="", max_features=800):
     # Get unique words, and filter out any single-letter words (like 'a')
     unique_query_words = list(set(w for w in query_stop_words if len(w) > 1))
 
-    final_stop_words = JUNK_STOP_WORDS + unique_query_words
+    final_stop_words = list(ENGLISH_STOP_WORDS) + JUNK_STOP_WORDS + unique_query_words
 
-    vectorizer = TfidfVectorizer(
-        max_features=max_features,
+    # Tokenize once: the tokens are hashed into features (no vocabulary to
+    # build or sort) and reused for the per-cluster top keywords
+    analyzer = HashingVectorizer(
         stop_words=final_stop_words,
         ngram_range=(1, 2)
-    )
-    X = vectorizer.fit_transform(corpus)
-
-    # If nnz (number of non-zero) is 0, all data was stopped out.
-    if X.nnz == 0:
-        print("Warning: Preprocessing removed all features. Skipping clustering.")
-        labels_list = [0] * len(videos)
-        cluster_name_map = { 0: FALLBACK_NAME }
-        return {
-            "labels": labels_list,
-            "cluster_name_map": cluster_name_map,
-            "plot_data": [],
-            "top_keywords": {}
-        }
+    ).build_analyzer()
+    doc_tokens = [analyzer(doc) for doc in corpus]
 
-    # KMeans
-    kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(X)
+    # Get top keywords for each cluster
+    top_keywords = get_top_keywords_per_cluster(labels, doc_tokens, cluster_name_map)
 
-    # Map each cluster to a human name via keyword counting
-    cluster_name_map = map_clusters_to_names(videos, labels)
+    vectorizer = HashingVectorizer(
+        analyzer=_pretokenized,
+        n_features=n_features,
+        alternate_sign=False,
+        norm=None
+    )
+    # Re-weight the raw hashed counts with IDF (and L2-normalize) as before
+    X = TfidfTransformer().fit_transform(vectorizer.transform(doc_tokens))
 
-    # Get top keywords for each cluster
-    top_keywords = get_top_keywords_per_cluster(kmeans, vectorizer, cluster_name_map)
-    
-    # Run t-SNE for 2D plot data
-    # t-SNE perplexity must be less than n_samples
-    perplexity_value = min(5, len(videos) - 1)
-    if perplexity_value <= 0:
-        perplexity_value = 1 # Set a minimum perplexity
-    
+    # Project to 2D for the plot. TruncatedSVD works on the sparse TF-IDF
+    # matrix directly, so there is no dense copy and no iterative t-SNE fit.
     plot_data = []
-    try:
-        tsne = TSNE(
-            n_components=2, 
-            random_state=42, 
-            perplexity=perplexity_value,
-            init='random',
-            max_iter=250 # Faster, good enough for a plot
-        )
-        # .toarray() is fine since we only have max 50 videos
-        coords = tsne.fit_transform(X.toarray())
-        
-        # Build data for Chart.js scatter plot
-        for i, video in enumerate(videos):
-            label_index = int(labels[i])
-            plot_data.append({
-                "x": float(coords[i, 0]),
-                "y": float(coords[i, 1]),
-                "label": cluster_name_map.get(label_index, "Other"),
-                "title": video["title"] # For the tooltip
-            })
-    except Exception as e:
-        print(f"Error during t-SNE, skipping plot: {e}")
-        plot_data = [] # Return empty list if t-SNE fails
+    if X.nnz == 0:
+        # All text was stopped out: nothing to plot, labels still stand
+        print("Warning: Preprocessing removed all features. Skipping plot.")
+    elif len(videos) > 1:
+        try:
+            svd = TruncatedSVD(n_components=2, random_state=42)
+            coords = svd.fit_transform(X)
+
+            # Build data for Chart.js scatter plot
+            for i, video in enumerate(videos):
+                plot_data.append({
+                    "x": float(coords[i, 0]),
+                    "y": float(coords[i, 1]),
+                    "label": cluster_name_map.get(labels[i], "Other"),
+                    "title": video["title"] # For the tooltip
+                })
+        except Exception as e:
+            print(f"Error during SVD projection, skipping plot: {e}")
+            plot_data = [] # Return empty list if the projection fails
 
-    
     # Return all results in a dictionary
     return {
-        "labels": list(map(int, labels)),
+        "labels": labels,
         "cluster_name_map": cluster_name_map,
         "plot_data": plot_data,
         "top_keywords": top_keywords
@@ -1,51 +1,139 @@
 import os
 import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from cachetools import TTLCache
 from googleapiclient.discovery import build
+from googleapiclient.http import build_http
 from dotenv import load_dotenv
 
 load_dotenv()
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 
+DEFAULT_MAX_RESULTS = 50
+
+# Partial response for videos.list: the snippet, statistics and
+# contentDetails fields search_youtube_covers actually uses
+VIDEO_DETAIL_FIELDS = (
+    'items(id,'
+    'snippet(title,channelTitle,publishedAt,description,'
+    'thumbnails/medium/url,thumbnails/default/url),'
+    'statistics/viewCount,'
+    'contentDetails/duration)'
+)
+
+# Building the client parses the discovery document and generates the
+# resource classes, so do it once at import and share it between searches.
+# Without an API key the module still imports (the search just can't run).
+_YOUTUBE = build(
+    'youtube', 'v3',
+    developerKey=YOUTUBE_API_KEY,
+    cache_discovery=False,
+    static_discovery=True
+) if YOUTUBE_API_KEY else None
+
+# Each httplib2.Http keeps its TLS connection to the API host open, so
+# reusing one skips a fresh handshake on every call (gzip is already
+# negotiated by googleapiclient). Http objects aren't thread-safe, so each
+# call checks one out of this pool and hands it back afterwards; that way
+# the connections outlive the per-request threads of the Flask dev server
+# as well as gunicorn's long-lived worker threads.
+_HTTP_POOL_SIZE = 4
+_HTTP_POOL = []
+_HTTP_POOL_LOCK = threading.Lock()
+
+@contextmanager
+def _pooled_http():
+    with _HTTP_POOL_LOCK:
+        http = _HTTP_POOL.pop() if _HTTP_POOL else None
+    if http is None:
+        http = build_http()
+    try:
+        yield http
+    finally:
+        with _HTTP_POOL_LOCK:
+            if len(_HTTP_POOL) < _HTTP_POOL_SIZE:
+                _HTTP_POOL.append(http)
+
+# Search results keyed by normalized song query. Every miss costs 101 quota
+# units (search.list = 100, videos.list = 1), so keep results for 6 hours.
+_SEARCH_CACHE = TTLCache(maxsize=512, ttl=6 * 60 * 60)
+# TTLCache updates its internal state on every read and write and is not
+# thread-safe, so all access goes through this lock
+_SEARCH_CACHE_LOCK = threading.Lock()
+
+def _cache_key(song_query):
+    return song_query.strip().lower()
+
+def _is_cacheable_request(max_results):
+    # Only the default-sized search is cached, so a smaller one-off search
+    # can never be served (or poison the cache) with a different result set.
+    return max_results == DEFAULT_MAX_RESULTS
+
+def get_cached_search(song_query):
+    """
+    Return the cached default-sized search for song_query, or None when it
+    isn't cached. Never calls the API.
+    """
+    with _SEARCH_CACHE_LOCK:
+        cached = _SEARCH_CACHE.get(_cache_key(song_query))
+    if cached is None:
+        return None
+    # Hand out copies; callers annotate the video dicts in place
+    return [dict(v) for v in cached]
+
+def clear_cache():
+    """Drop all cached search results."""
+    with _SEARCH_CACHE_LOCK:
+        _SEARCH_CACHE.clear()
+
+# Captures the H, M and S components of a duration like "PT1H5M10S"
+_ISO_DURATION_RE = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+
 # This function parses YouTube's ISO 8601 duration format (e.g., "PT2M3S")
 # into a more friendly format (e.g., "2:03" or "1:05:10")
 def parse_iso8601_duration(duration_str):
     if not duration_str or not duration_str.startswith('PT'):
         return "N/A"
 
-    hours, minutes, seconds = 0, 0, 0
-
-    # Regex to find H, M, S components
-    hour_match = re.search(r'(\d+)H', duration_str)
-    minute_match = re.search(r'(\d+)M', duration_str)
-    second_match = re.search(r'(\d+)S', duration_str)
+    match = _ISO_DURATION_RE.fullmatch(duration_str)
+    if not match:
+        return "N/A"
 
-    if hour_match:
-        hours = int(hour_match.group(1))
-    if minute_match:
-        minutes = int(minute_match.group(1))
-    if second_match:
-        seconds = int(second_match.group(1))
+    hours, minutes, seconds = (int(g) if g else 0 for g in match.groups())
 
     if hours > 0:
         return f"{hours}:{minutes:02d}:{seconds:02d}"
     else:
         return f"{minutes}:{seconds:02d}"
 
-def search_youtube_covers(song_query, max_results=50):
+def search_youtube_covers(song_query, max_results=DEFAULT_MAX_RESULTS):
     if max_results > 50:
         max_results = 50
-    
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
 
-    # 1. Search for videos to get their IDs
+    cacheable = _is_cacheable_request(max_results)
+    key = _cache_key(song_query)
+    if cacheable:
+        cached = get_cached_search(song_query)
+        if cached is not None:
+            return cached
+
+    if _YOUTUBE is None:
+        raise RuntimeError("YOUTUBE_API_KEY is not set")
+    youtube = _YOUTUBE
+
+    # 1. Search for videos to get their IDs (only the IDs are returned)
     request = youtube.search().list(
         q=f"{song_query} cover",
-        part='snippet',
+        part='id',
         type='video',
         maxResults=max_results,
-        order='relevance'
+        order='relevance',
+        fields='items/id/videoId'
     )
-    response = request.execute()
+    with _pooled_http() as http:
+        response = request.execute(http=http)
 
     video_ids = [] # Collect all video IDs for a single batch request
     snippet_data = {}
@@ -53,15 +141,22 @@ def search_youtube_covers(song_query, max_results=50):
         video_ids.append(item['id']['videoId'])
 
     if not video_ids:
+        # A search with no hits still cost 100 units; cache that too
+        if cacheable:
+            with _SEARCH_CACHE_LOCK:
+                _SEARCH_CACHE[key] = []
         return []
 
     # 2. Get all details for the found video IDs in one batch call
     #    We now request 'snippet', 'statistics', and 'contentDetails'
+    #    'fields' trims the response to just what is read below
     video_details_request = youtube.videos().list(
         part='snippet,statistics,contentDetails',
-        id=','.join(video_ids)
+        id=','.join(video_ids),
+        fields=VIDEO_DETAIL_FIELDS
     )
-    video_details_response = video_details_request.execute()
+    with _pooled_http() as http:
+        video_details_response = video_details_request.execute(http=http)
 
     videos = []
     # Loop through the full details response
@@ -74,7 +169,9 @@ def search_youtube_covers(song_query, max_results=50):
         # Extract all data from the video.list response
         title = snippet.get('title', 'No Title')
         channel = snippet.get('channelTitle', 'No Channel')
-        upload_date = snippet.get('publishedAt', '')[:10]
+        # Parsed once here; analytics and templates use the date as-is
+        published_at = snippet.get('publishedAt')
+        upload_date = datetime.fromisoformat(published_at.replace('Z', '+00:00')).date() if published_at else None
         thumbnail = snippet.get('thumbnails', {}).get('medium', {}).get('url')
         description = snippet.get('description', '') 
 
@@ -98,4 +195,8 @@ def search_youtube_covers(song_query, max_results=50):
             "description": description
         })
 
+    if cacheable:
+        with _SEARCH_CACHE_LOCK:
+            _SEARCH_CACHE[key] = [dict(v) for v in videos]
+
     return videos